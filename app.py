@@ -1,50 +1,234 @@
 # app.py
 import streamlit as st
 import pandas as pd
+import numpy as np
 import sqlite3
 import bcrypt
-import matplotlib.pyplot as plt
 from datetime import datetime
+from collections import defaultdict
 import os
+import io
+import threading
+import tempfile
+import hashlib
+import hmac
+import secrets
+import time
 
 # ------------------ Database Setup ------------------
-conn = sqlite3.connect("users.db", check_same_thread=False)
-c = conn.cursor()
-c.execute('''CREATE TABLE IF NOT EXISTS users (
-    username TEXT PRIMARY KEY,
-    password TEXT NOT NULL
-)''')
-conn.commit()
+QUERIES = {
+    "insert_user": "INSERT INTO users (username, password) VALUES (?, ?)",
+    "select_password": "SELECT password FROM users WHERE username=?",
+}
+
+@st.cache_resource
+def get_conn():
+    # Reused across reruns and sessions; autocommit, with a fresh cursor per query
+    conn = sqlite3.connect("users.db", check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-8000")
+    conn.execute('''CREATE TABLE IF NOT EXISTS users (
+        username TEXT PRIMARY KEY,
+        password BLOB NOT NULL
+    )''')
+    return conn
 
 # ------------------ Auth Functions ------------------
+BCRYPT_ROUNDS = 10
+
 def signup_user(username, password):
-    hashed_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    hashed_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
     try:
-        c.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_pw))
-        conn.commit()
+        get_conn().execute(QUERIES["insert_user"], (username, hashed_pw))
         return True
     except sqlite3.IntegrityError:
         return False
 
 def login_user(username, password):
-    c.execute("SELECT password FROM users WHERE username=?", (username,))
-    result = c.fetchone()
-    if result and bcrypt.checkpw(password.encode(), result[0].encode()):
-        return True
-    return False
+    result = get_conn().execute(QUERIES["select_password"], (username,)).fetchone()
+    if not result:
+        _record_login(username, False)
+        return False
+    hashed_pw = result[0]
+    if isinstance(hashed_pw, str):
+        # Accounts created before hashes were stored as bytes
+        hashed_pw = hashed_pw.encode()
+    ok = bcrypt.checkpw(password.encode(), hashed_pw)
+    _record_login(username, ok)
+    return ok
+
+LOGIN_MAX_FAILURES = 5
+LOGIN_LOCKOUT_SECONDS = 60
+
+@st.cache_resource
+def _login_failures():
+    # username -> (failed attempts, time of first failure), shared across sessions
+    return {}
+
+@st.cache_resource
+def _login_lock():
+    return threading.Lock()
+
+def login_throttled(username):
+    with _login_lock():
+        count, since = _login_failures().get(username, (0, 0.0))
+    return count >= LOGIN_MAX_FAILURES and time.monotonic() - since < LOGIN_LOCKOUT_SECONDS
+
+def _record_login(username, ok):
+    failures = _login_failures()
+    now = time.monotonic()
+    with _login_lock():
+        if ok:
+            failures.pop(username, None)
+            return
+        # Drop expired windows so unknown usernames can't grow the dict without bound
+        for name in [n for n, (_, since) in failures.items() if now - since >= LOGIN_LOCKOUT_SECONDS]:
+            del failures[name]
+        count, since = failures.get(username, (0, now))
+        failures[username] = (count + 1, since)
+
+@st.cache_resource
+def _token_key():
+    return secrets.token_bytes(32)
+
+def session_token(username, password):
+    # Cheap keyed digest so a repeat login in the same session skips bcrypt
+    msg = username.encode() + b"\0" + password.encode()
+    return hashlib.blake2b(msg, key=_token_key()).hexdigest()
+
+def session_token_matches(username, password):
+    token = st.session_state.get("auth_token")
+    return token is not None and hmac.compare_digest(token, session_token(username, password))
 
 # ------------------ Expense File Functions ------------------
+COLUMNS = ["Date", "Category", "Description", "Amount"]
+CATEGORIES = ("Food", "Transport", "Bills", "Shopping", "Other")
+CAT_DTYPE = pd.CategoricalDtype(CATEGORIES)
+
+# Bounds the mtime-keyed caches; every save adds a new key and old ones are never hit again
+CACHE_MAX_ENTRIES = 64
+
+def _expense_file(username):
+    return f"data/{username}_expenses.parquet"
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def _load(username, mtime):
+    # mtime is only part of the cache key, so a save invalidates the entry
+    if mtime is not None:
+        df = pd.read_parquet(_expense_file(username), engine="pyarrow")
+    else:
+        df = pd.DataFrame(columns=COLUMNS).astype({"Date": "datetime64[ns]", "Amount": "float64"})
+    extra = sorted(set(df["Category"].dropna()) - set(CATEGORIES))
+    if extra:
+        # Labels from older data are kept as extra categories rather than nulled out
+        st.warning(f"Some expenses use unrecognised categories: {', '.join(map(str, extra))}")
+        df["Category"] = df["Category"].astype(pd.CategoricalDtype(CATEGORIES + tuple(extra)))
+    else:
+        df["Category"] = df["Category"].astype(CAT_DTYPE)
+    # Kept in date order so the table can render a reversed view without sorting
+    return df.sort_values("Date", kind="stable").reset_index(drop=True)
+
 def load_expense_data(username):
     os.makedirs("data", exist_ok=True)
-    file = f"data/{username}_expenses.csv"
-    if os.path.exists(file):
-        return pd.read_csv(file, parse_dates=["Date"])
-    return pd.DataFrame(columns=["Date", "Category", "Description", "Amount"])
+    legacy = f"data/{username}_expenses.csv"
+    if not os.path.exists(_expense_file(username)) and os.path.exists(legacy):
+        # One-time migration of CSV data written by older versions
+        save_expense_data(username, pd.read_csv(legacy, parse_dates=["Date"]))
+    # Stat once and key the load on that value, so callers can record exactly what they read
+    mtime = expense_mtime(username)
+    return _load(username, mtime), mtime
+
+def expense_mtime(username):
+    # Integer nanoseconds; float seconds can make two quick saves compare equal
+    file = _expense_file(username)
+    return os.stat(file).st_mtime_ns if os.path.exists(file) else None
 
 def save_expense_data(username, df):
     os.makedirs("data", exist_ok=True)
-    file = f"data/{username}_expenses.csv"
-    df.to_csv(file, index=False)
+    # Category is stored as plain strings; the categorical dtype only exists in memory
+    df = df.astype({"Date": "datetime64[ns]", "Category": "object", "Amount": "float64"})
+    # Write to a temp file and swap it in so a failed write never truncates history
+    fd, tmp = tempfile.mkstemp(dir="data", suffix=".parquet.tmp")
+    os.close(fd)
+    try:
+        df.to_parquet(tmp, engine="pyarrow", compression="zstd", index=False)
+        # os.replace keeps the temp file's mtime, so this identifies exactly what we wrote
+        mtime = os.stat(tmp).st_mtime_ns
+        os.replace(tmp, _expense_file(username))
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return mtime
+
+def save_with_rows(username, rows, df):
+    # Parquet files can't be appended to, so this rewrites the whole file with rows added
+    new = pd.DataFrame(rows, columns=COLUMNS).astype({"Date": "datetime64[ns]", "Category": df["Category"].dtype})
+    df = pd.concat([df, new], ignore_index=True)
+    if not df["Date"].is_monotonic_increasing:
+        # Backdated entry; the common append-in-order case skips the sort
+        df = df.sort_values("Date", kind="stable").reset_index(drop=True)
+    return df, save_expense_data(username, df)
+
+@st.cache_resource
+def _write_lock():
+    return threading.Lock()
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def category_sum(username, mtime):
+    df = _load(username, mtime)
+    categories = df["Category"].cat.categories
+    codes = df["Category"].cat.codes.to_numpy()
+    valid = codes >= 0
+    sums = np.bincount(codes[valid], weights=df["Amount"].to_numpy(dtype="float64")[valid], minlength=len(categories))
+    # Order by first appearance, as groupby(sort=False) did, so pie wedges keep their order
+    present, first = np.unique(codes[valid], return_index=True)
+    order = present[np.argsort(first)]
+    return pd.Series(sums[order], index=categories[order], name="Amount")
+
+def top_by_category(df):
+    # Largest expense per category via idxmax rather than a per-group apply
+    if df.empty:
+        return df
+    return df.loc[df.groupby("Category", observed=True)["Amount"].idxmax()]
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def monthly_sum(username, mtime):
+    df = _load(username, mtime)
+    months = df["Date"].to_numpy(dtype="datetime64[ns]").astype("datetime64[M]")
+    valid = ~np.isnat(months)
+    keys, inverse = np.unique(months[valid], return_inverse=True)
+    sums = np.bincount(inverse, weights=df["Amount"].to_numpy(dtype="float64")[valid], minlength=len(keys))
+    return pd.Series(sums, index=keys.astype(str), name="Amount")
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def pie_png(items):
+    # Imported lazily so reruns that never draw charts skip matplotlib's startup
+    from matplotlib.figure import Figure
+    labels, values = zip(*items)
+    # A bare Figure stays out of pyplot's global registry; only the PNG bytes are cached
+    fig = Figure()
+    ax = fig.subplots()
+    ax.pie(values, labels=labels, autopct="%1.1f%%")
+    ax.axis('equal')
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
+
+@st.cache_data(show_spinner=False, ttl=60, max_entries=CACHE_MAX_ENTRIES)
+def expense_csv(username, mtime, _df):
+    # _df isn't hashed; it is the session frame, which is exactly the file as of mtime
+    buf = io.BytesIO()
+    _df.to_csv(buf, index=False, encoding='utf-8')
+    return buf.getvalue()
+
+def load_session(username):
+    st.session_state.df, mtime = load_expense_data(username)
+    st.session_state.cat_sum = defaultdict(float, category_sum(username, mtime).to_dict())
+    st.session_state.month_sum = defaultdict(float, monthly_sum(username, mtime).to_dict())
+    st.session_state.loaded_for = username
+    st.session_state.loaded_mtime = mtime
 
 # ------------------ Streamlit App UI ------------------
 st.set_page_config(page_title="Expense Tracker", layout="wide")
@@ -75,9 +259,14 @@ elif choice == "Login":
     username = st.text_input("Username", key="login_user")
     password = st.text_input("Password", type='password', key="login_pass")
     if st.button("Login"):
-        if login_user(username.strip(), password):
+        user = username.strip()
+        token_ok = session_token_matches(user, password)
+        if not token_ok and login_throttled(user):
+            st.error("Too many failed attempts. Please try again in a minute.")
+        elif token_ok or login_user(user, password):
             st.session_state.logged_in = True
-            st.session_state.username = username.strip()
+            st.session_state.username = user
+            st.session_state.auth_token = session_token(user, password)
             st.success(f"Welcome, {username}!")
         else:
             st.error("Incorrect username or password.")
@@ -87,49 +276,53 @@ if st.session_state.logged_in:
     username = st.session_state.username
     st.sidebar.success(f"Logged in as {username}")
 
-    df = load_expense_data(username)
+    # Load once per login; inserts then patch the frame and totals in place
+    if st.session_state.get("loaded_for") != username:
+        with _write_lock():
+            load_session(username)
+    df = st.session_state.df
 
     # Form to Add Expense
     st.sidebar.header("Add Expense")
     with st.sidebar.form("expense_form"):
         date = st.date_input("Date", value=datetime.today())
-        category = st.selectbox("Category", ["Food", "Transport", "Bills", "Shopping", "Other"])
+        category = st.selectbox("Category", CATEGORIES)
         description = st.text_input("Description")
         amount = st.number_input("Amount", min_value=0.0, format="%.2f")
         submitted = st.form_submit_button("Add")
         if submitted:
-            new_data = pd.DataFrame([[date, category, description, amount]],
-                                    columns=["Date", "Category", "Description", "Amount"])
-            df = pd.concat([df, new_data], ignore_index=True)
-            save_expense_data(username, df)
+            row = {"Date": date, "Category": category, "Description": description, "Amount": amount}
+            with _write_lock():
+                if expense_mtime(username) != st.session_state.loaded_mtime:
+                    # Another session saved since we loaded; rebuild from disk so its rows survive
+                    load_session(username)
+                df, st.session_state.loaded_mtime = save_with_rows(username, [row], st.session_state.df)
+                st.session_state.df = df
+            st.session_state.cat_sum[category] += amount
+            st.session_state.month_sum[date.strftime("%Y-%m")] += amount
             st.success("Expense added successfully.")
 
     # Show Table
     st.subheader("📄 Expense Table")
     if not df.empty:
-        st.dataframe(df.sort_values("Date", ascending=False), use_container_width=True)
+        st.dataframe(df.iloc[::-1], use_container_width=True)
 
         # Visuals
         st.subheader("📊 Visualizations")
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.markdown("### Category-wise Expenses")
-            category_sum = df.groupby("Category")["Amount"].sum()
-            fig1, ax1 = plt.subplots()
-            ax1.pie(category_sum, labels=category_sum.index, autopct="%1.1f%%")
-            ax1.axis('equal')
-            st.pyplot(fig1)
-
-        with col2:
-            st.markdown("### Monthly Expense Trend")
-            df['Month'] = pd.to_datetime(df['Date']).dt.to_period('M').astype(str)
-            monthly_sum = df.groupby("Month")["Amount"].sum()
-            st.line_chart(monthly_sum)
+        if st.toggle("Show charts", key="show_charts"):
+            col1, col2 = st.columns(2)
+
+            with col1:
+                st.markdown("### Category-wise Expenses")
+                st.image(pie_png(tuple(st.session_state.cat_sum.items())))
+
+            with col2:
+                st.markdown("### Monthly Expense Trend")
+                st.line_chart(pd.Series(st.session_state.month_sum, name="Amount").sort_index())
 
         st.download_button(
             label="⬇ Download My Expenses (CSV)",
-            data=df.to_csv(index=False).encode('utf-8'),
+            data=expense_csv(username, st.session_state.loaded_mtime, df),
             file_name=f"{username}_expenses.csv",
             mime="text/csv"
         )
@@ -139,4 +332,8 @@ if st.session_state.logged_in:
     if st.button("Logout"):
         st.session_state.logged_in = False
         st.session_state.username = ""
-        st.experimental_rerun()
+        st.session_state.pop("loaded_for", None)
+        st.session_state.pop("df", None)
+        st.session_state.pop("loaded_mtime", None)
+        st.session_state.pop("auth_token", None)
+        st.rerun()
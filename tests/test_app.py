@@ -0,0 +1,109 @@
+import datetime
+import importlib.util
+import os
+
+import pandas as pd
+import pytest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # app.py is a Streamlit script; import it from a scratch dir so users.db and data/ land there
+    monkeypatch.chdir(tmp_path)
+    spec = importlib.util.spec_from_file_location("app", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.st.cache_data.clear()
+    return module
+
+
+def make_df(app):
+    df = pd.DataFrame({
+        "Date": pd.to_datetime(["2024-03-05", "2024-01-02", "2024-03-01", "2024-01-20", "2024-02-11"]),
+        "Category": ["Bills", "Food", "Bills", "Transport", "Food"],
+        "Description": ["a", "b", "c", "d", "e"],
+        "Amount": [40.0, 5.0, 12.5, 30.0, 7.0],
+    })
+    return df.astype({"Date": "datetime64[ns]", "Category": app.CAT_DTYPE})
+
+
+def test_category_sum_matches_groupby(app):
+    df = make_df(app)
+    app.save_expense_data("u", df)
+
+    # _load sorts by Date, so compare against groupby over the same ordering
+    loaded, mtime = app.load_expense_data("u")
+    expected = loaded.groupby("Category", observed=True, sort=False)["Amount"].sum()
+    result = app.category_sum("u", mtime)
+
+    assert list(result.index) == list(expected.index)
+    assert result.tolist() == expected.tolist()
+
+
+def test_monthly_sum_matches_groupby(app):
+    df = make_df(app)
+    app.save_expense_data("u", df)
+
+    _, mtime = app.load_expense_data("u")
+    expected = df.groupby(df["Date"].dt.to_period("M").astype(str))["Amount"].sum()
+    result = app.monthly_sum("u", mtime)
+
+    assert list(result.index) == ["2024-01", "2024-02", "2024-03"]
+    assert result.to_dict() == expected.to_dict()
+
+
+def test_parquet_round_trip(app):
+    df = make_df(app).sort_values("Date").reset_index(drop=True)
+    written_mtime = app.save_expense_data("u", df)
+
+    loaded, mtime = app.load_expense_data("u")
+
+    assert mtime == written_mtime
+    assert loaded["Date"].dtype == "datetime64[ns]"
+    assert loaded["Category"].dtype == app.CAT_DTYPE
+    pd.testing.assert_frame_equal(loaded, df)
+
+
+def test_legacy_csv_is_migrated(app):
+    os.makedirs("data", exist_ok=True)
+    with open("data/u_expenses.csv", "w") as f:
+        f.write("Date,Category,Description,Amount\n2024-02-01,Rent,r,100\n2024-01-01,Food,f,5\n")
+
+    loaded, mtime = app.load_expense_data("u")
+
+    assert os.path.exists("data/u_expenses.parquet")
+    assert mtime is not None
+    assert loaded["Description"].tolist() == ["f", "r"]
+    # Labels outside the fixed set are kept rather than turned into NaN
+    assert loaded["Category"].astype(str).tolist() == ["Food", "Rent"]
+
+
+def test_save_with_rows_casts_and_resorts_backdated_rows(app):
+    df = make_df(app).sort_values("Date").reset_index(drop=True)
+    app.save_expense_data("u", df)
+    rows = [{"Date": datetime.date(2024, 1, 10), "Category": "Shopping", "Description": "x", "Amount": 3.0}]
+
+    result, mtime = app.save_with_rows("u", rows, df)
+
+    assert result["Date"].dtype == "datetime64[ns]"
+    assert result["Category"].dtype == app.CAT_DTYPE
+    assert result["Date"].is_monotonic_increasing
+    assert result["Description"].tolist() == ["b", "x", "d", "e", "c", "a"]
+    assert mtime == app.expense_mtime("u")
+    reloaded, _ = app.load_expense_data("u")
+    pd.testing.assert_frame_equal(reloaded, result)
+
+
+def test_top_by_category_returns_max_row_per_observed_category(app):
+    top = app.top_by_category(make_df(app))
+
+    assert len(top) == 3
+    by_category = dict(zip(top["Category"].astype(str), top["Amount"]))
+    assert by_category == {"Food": 7.0, "Bills": 40.0, "Transport": 30.0}
+
+
+def test_top_by_category_empty(app):
+    df = pd.DataFrame(columns=app.COLUMNS)
+    assert app.top_by_category(df).empty